@@ -5,16 +5,60 @@ Returns only VCT Tier 1 matches (Americas, EMEA, APAC, CN)
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import httpx
-from bs4 import BeautifulSoup
+import lxml.html
+from lxml import etree
 import re
-from datetime import datetime
+import asyncio
+import random
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache, partial
+from datetime import date, datetime
 import logging
+import os
 
-logging.basicConfig(level=logging.INFO)
+# WARNING by default so per-match messages stay unformatted; set LOG_LEVEL=INFO/DEBUG to see them
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "WARNING").upper(),
+    format="%(asctime)s %(levelname)s %(name)s %(message)s",
+)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="VCT Tier 1 Backend", version="2.0.0")
+# Shared client so keep-alive connections to vlr.gg are reused across requests
+CLIENT: httpx.AsyncClient | None = None
+
+def _client():
+    """
+    Create the shared client on first use rather than at startup, since
+    not every ASGI host (e.g. Vercel's Python runtime) sends lifespan events.
+    _bind_loop drops it again if requests move to another event loop.
+    """
+    global CLIENT
+    if CLIENT is None:
+        CLIENT = httpx.AsyncClient(
+            base_url="https://www.vlr.gg",
+            http2=True,
+            timeout=httpx.Timeout(connect=3.0, read=10.0, write=5.0, pool=2.0),
+            headers=HEADERS,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        )
+    return CLIENT
+
+@asynccontextmanager
+async def lifespan(app):
+    global CLIENT
+    try:
+        yield
+    finally:
+        if CLIENT is not None:
+            await CLIENT.aclose()
+            CLIENT = None
+
+app = FastAPI(title="VCT Tier 1 Backend", version="2.0.0", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,6 +74,219 @@ HEADERS = {
 }
 
 TIER1_EVENTS = ["VCT", "Americas", "EMEA", "APAC", "CN", "Pacific"]
+# One case-insensitive scan of the event text instead of a substring test per tier.
+# "Americas" and "Pacific" are left out: the old check compared them against
+# upper-cased text, so they never matched, and adding them would admit
+# Challengers/Game Changers events. CN only counts as a whole word.
+TIER1_RE = re.compile(r"VCT|EMEA|APAC|\bCN\b", re.IGNORECASE)
+
+def _has_class(name):
+    """XPath predicate matching a whole class token, like a CSS `.name` selector"""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+# XPath expressions are compiled once at import and reused for every request
+# Date headers (div.wf-label.mod-large) and match items, in document order
+_LISTING_NODES = etree.XPath(
+    f"//div[{_has_class('wf-label')} and {_has_class('mod-large')}] | //*[{_has_class('match-item')}]"
+)
+# Every per-item field we read, fetched in a single descendant walk
+_ITEM_PART_CLASSES = ("match-item-vs-team-name", "match-item-event", "match-item-event-series", "match-item-time")
+_ITEM_PARTS = etree.XPath(".//*[" + " or ".join(_has_class(c) for c in _ITEM_PART_CLASSES) + "]")
+
+_MATCH_ID_RE = re.compile(r'/(\d+)/')
+
+MONTH_NUM = {
+    name: number for number, name in enumerate(
+        ["January", "February", "March", "April", "May", "June",
+         "July", "August", "September", "October", "November", "December"],
+        start=1,
+    )
+}
+
+def _item_parts(item):
+    """Group a match item's team-name, event and time nodes by class"""
+    parts = {}
+    for el in _ITEM_PARTS(item):
+        for cls in el.get("class", "").split():
+            if cls in _ITEM_PART_CLASSES:
+                parts.setdefault(cls, []).append(el)
+    return parts
+
+def _text(el):
+    """Concatenate the stripped text nodes under an element"""
+    return "".join(s.strip() for s in el.itertext())
+
+@lru_cache(maxsize=512)
+def _parse_date_header(header):
+    """Turn a "Thu, January 8, 2026" header into "2026-01-08" without strptime"""
+    _, month_day, year = header.split(",")
+    month, day = month_day.split()
+    return date(int(year), MONTH_NUM[month], int(day)).isoformat()
+
+# 10000-01-01T00:00:00Z
+_MAX_TS = 253402300800
+
+@lru_cache(maxsize=4096)
+def _utc_iso(ts):
+    """Same output as datetime.utcfromtimestamp(ts).isoformat() for whole seconds"""
+    # datetime stops at year 9999; raise like it does so callers fall back
+    if ts >= _MAX_TS:
+        raise ValueError(f"year is out of range for timestamp {ts}")
+    t = time.gmtime(ts)
+    return f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d}T{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}"
+
+def _parse_html(content, encoding):
+    """
+    Parse raw response bytes without decoding them to str first.
+    The charset from Content-Type is passed through so libxml2 doesn't
+    have to sniff it (and fall back to Latin-1 on non-ASCII team names).
+    """
+    parser = lxml.html.HTMLParser(encoding=encoding or "utf-8")
+    return lxml.html.fromstring(content, parser=parser)
+
+# Upper bound on concurrent requests to vlr.gg, however many clients hit us
+MAX_UPSTREAM_REQUESTS = 8
+_VLR_SEM = asyncio.Semaphore(MAX_UPSTREAM_REQUESTS)
+
+# Rate limiting and transient server errors are retried with backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_ATTEMPTS = 3
+
+async def _vlr_get(path, headers=None):
+    for attempt in range(MAX_ATTEMPTS):
+        async with _VLR_SEM:
+            response = await _client().get(path, headers=headers)
+        if response.status_code not in RETRY_STATUSES or attempt == MAX_ATTEMPTS - 1:
+            break
+        # Back off outside the semaphore so other fetches can use the slot
+        await asyncio.sleep(2 ** attempt + random.random())
+    if response.status_code != 304:
+        response.raise_for_status()
+    return response
+
+# Response cache: key -> (stored_at, payload, validators), least recently
+# used first. `validators` are the conditional request headers from the page
+# the payload was parsed from, so a refresh of an unchanged page is an empty 304.
+# Only touched from the event loop.
+_CACHE: OrderedDict[str, tuple[float, dict, dict]] = OrderedDict()
+_CACHE_MAX_ENTRIES = 512
+_REFRESHING: dict[str, asyncio.Task] = {}
+# Scrapes currently running, so concurrent misses on a key share one fetch
+_INFLIGHT: dict[str, asyncio.Task] = {}
+
+MATCHES_TTL = 30
+MATCH_TTL = 60
+STALE_WHILE_REVALIDATE = 60
+# Past this, a caller gets the last cached payload (if any) instead of waiting
+SCRAPE_DEADLINE = 8.0
+
+# How many /match/{id} pages to warm after each fresh /matches scrape.
+# Off while the /match/{id} payload doesn't read anything from the page:
+# warming it would only add upstream GETs that risk vlr.gg throttling.
+PREFETCH_MATCHES = 0
+# Most match ids accepted by one /matches/batch call
+MAX_BATCH_IDS = 20
+_BACKGROUND: set[asyncio.Task] = set()
+
+def _validators(response):
+    """If-None-Match / If-Modified-Since headers for revalidating `response`"""
+    validators = {}
+    if "etag" in response.headers:
+        validators["If-None-Match"] = response.headers["etag"]
+    if "last-modified" in response.headers:
+        validators["If-Modified-Since"] = response.headers["last-modified"]
+    return validators
+
+def _store(key, payload, validators):
+    _CACHE[key] = (time.monotonic(), payload, validators)
+    _CACHE.move_to_end(key)
+    if len(_CACHE) > _CACHE_MAX_ENTRIES:
+        _CACHE.popitem(last=False)
+
+async def _fill(key, fetch):
+    try:
+        # Scrapers return (payload, validators) so both are stored together
+        payload, validators = await fetch()
+        _store(key, payload, validators)
+        return payload
+    finally:
+        _INFLIGHT.pop(key, None)
+
+def _single_flight(key, fetch):
+    """Return the running scrape for `key`, starting one if there is none"""
+    task = _INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.create_task(_fill(key, fetch))
+        task.add_done_callback(partial(_log_failed_fill, key))
+        _INFLIGHT[key] = task
+    return task
+
+def _log_failed_fill(key, task):
+    # Callers that hit SCRAPE_DEADLINE stop awaiting the scrape, so retrieve
+    # its exception here rather than leave asyncio to log it at ERROR
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Scrape of %s failed: %s", key, task.exception())
+
+async def _refresh(key, fetch):
+    try:
+        await _single_flight(key, fetch)
+    except Exception:
+        pass  # already logged by _log_failed_fill
+    finally:
+        _REFRESHING.pop(key, None)
+
+# Event loop that CLIENT, _VLR_SEM and the task maps currently belong to
+_LOOP: asyncio.AbstractEventLoop | None = None
+
+def _bind_loop():
+    """
+    Reset loop-bound state when called from a different event loop.
+    Under uvicorn the loop never changes, but hosts without lifespan events
+    (Vercel's Python runtime, TestClient used without `with`) may run each
+    request on a fresh loop, where the old client and tasks are unusable.
+    """
+    global CLIENT, _LOOP, _VLR_SEM
+    loop = asyncio.get_running_loop()
+    if loop is _LOOP:
+        return
+    _LOOP = loop
+    # The old client's connections belong to the old loop, so it can't be
+    # closed from here; drop it and let _client() build a new one
+    CLIENT = None
+    _VLR_SEM = asyncio.Semaphore(MAX_UPSTREAM_REQUESTS)
+    _INFLIGHT.clear()
+    _REFRESHING.clear()
+    _BACKGROUND.clear()
+
+async def _cached(key, ttl, fetch):
+    """
+    Return the cached payload for `key`, calling `fetch` on a miss.
+    Entries past `ttl` but inside the stale-while-revalidate window are
+    served as-is while a background task refreshes them. A scrape that
+    runs past SCRAPE_DEADLINE falls back to the last stored payload.
+    Payloads contain only JSON-native types, so handlers wrap them in
+    ORJSONResponse directly instead of going through jsonable_encoder.
+    """
+    _bind_loop()
+    entry = _CACHE.get(key)
+    if entry:
+        _CACHE.move_to_end(key)
+        age = time.monotonic() - entry[0]
+        if age < ttl:
+            return entry[1]
+        if age < ttl + STALE_WHILE_REVALIDATE:
+            if key not in _REFRESHING and key not in _INFLIGHT:
+                _REFRESHING[key] = asyncio.create_task(_refresh(key, fetch))
+            return entry[1]
+    
+    # Shielded so one caller giving up doesn't cancel the scrape for the rest
+    try:
+        return await asyncio.wait_for(asyncio.shield(_single_flight(key, fetch)), SCRAPE_DEADLINE)
+    except asyncio.TimeoutError:
+        if entry:
+            logger.warning("Scrape of %s is slow, serving stale copy", key)
+            return entry[1]
+        raise HTTPException(status_code=504, detail="Timed out fetching from VLR.gg")
 
 @app.get("/")
 async def root():
@@ -38,144 +295,210 @@ async def root():
 @app.get("/matches")
 async def get_all_matches():
     """Get all VCT Tier 1 matches with proper dates from VLR.gg"""
-    url = "https://www.vlr.gg/matches"
-    
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        try:
-            response = await client.get(url, headers=HEADERS, follow_redirects=True)
-            response.raise_for_status()
-        except Exception as e:
-            logger.error(f"Failed to fetch VLR.gg: {e}")
-            raise HTTPException(status_code=500, detail=f"Failed to fetch: {str(e)}")
-    
-    soup = BeautifulSoup(response.text, "lxml")
+    return ORJSONResponse(await _cached("matches", MATCHES_TTL, _scrape_matches))
+
+async def _scrape_matches():
+    path = "/matches"
+    cached = _CACHE.get("matches")
+
+    try:
+        response = await _vlr_get(path, cached[2] if cached else None)
+    except Exception as e:
+        logger.error("Failed to fetch VLR.gg: %s", e)
+        raise HTTPException(status_code=500, detail=f"Failed to fetch: {str(e)}")
+
+    # Unchanged since the cached copy: skip the parse and the prefetch
+    if response.status_code == 304:
+        return cached[1], cached[2]
+
+    # Parsing is CPU-bound; run it off the event loop so other requests keep moving
+    payload = await asyncio.to_thread(_parse_matches, response.content, response.charset_encoding)
+    if PREFETCH_MATCHES:
+        _spawn(_warm_matches([m["id"] for m in payload["matches"][:PREFETCH_MATCHES]]))
+    return payload, _validators(response)
+
+def _parse_matches(content, encoding):
+    """Build the /matches payload from the raw page (runs in a worker thread)"""
+    tree = _parse_html(content, encoding)
     matches = []
-    current_date = "2026-01-08"
+    # Fallback until a date header is seen, computed once per scrape
+    current_date = datetime.utcnow().date().isoformat()
     
     try:
-        # Get the main matches container
-        main_container = soup.select_one(".mod-dark")
-        if not main_container:
-            raise HTTPException(status_code=500, detail="Could not find matches container")
-        
-        # Iterate through all elements in mod-dark
-        for elem in main_container.find_all(recursive=True):
-            if not elem.name:
+        # Date headers and match items come back together in document order,
+        # so each match picks up the header directly above it
+        for node in _LISTING_NODES(tree):
+            if "match-item" not in node.get("class", "").split():
+                # Header text is "Thu, January 8, 2026", with an optional
+                # "Today" tag in a child span that we leave out
+                header = (node.text or "").strip()
+                try:
+                    current_date = _parse_date_header(header)
+                    logger.debug("Found date: %s", current_date)
+                except Exception as e:
+                    logger.warning("Failed to parse date '%s': %s", header, e)
                 continue
             
-            # Check for date headers (divs with month/date text)
-            if elem.name == 'div':
-                elem_text = elem.get_text(strip=True)
-                
-                # Check if this is a date header
-                if any(month in elem_text for month in ['January', 'February', 'March', 'April', 'May', 'June',
-                                                         'July', 'August', 'September', 'October', 'November', 'December']):
-                    if re.search(r'\d{1,2}', elem_text) and ',' in elem_text:
-                        try:
-                            # Parse "Thu, January 8, 2026" format
-                            parts = elem_text.split(',')
-                            if len(parts) >= 2:
-                                date_str = ','.join(parts[1:]).strip()
-                                parsed = datetime.strptime(date_str, "%B %d, %Y").date()
-                                current_date = parsed.isoformat()
-                                logger.info(f"Found date: {current_date}")
-                        except Exception as e:
-                            logger.warning(f"Failed to parse date '{elem_text}': {e}")
-        
-        # Now find all match items with the current_date tracking
-        all_match_items = soup.select(".match-item")
-        logger.info(f"Found {len(all_match_items)} total match items")
-        
-        for item in all_match_items:
             try:
-                # Get match ID
-                href = item.get("href", "")
-                match_id_match = re.search(r'/(\d+)/', href)
-                if not match_id_match:
-                    continue
-                match_id = match_id_match.group(1)
-                
-                # Get teams
-                teams = []
-                for team_el in item.select(".match-item-vs-team-name")[:2]:
-                    team_name = team_el.get_text(strip=True)
-                    if team_name:
-                        teams.append(team_name)
-                
-                if len(teams) < 2:
-                    continue
-                
-                # Get event name
-                event_el = item.select_one(".match-item-event")
-                if not event_el:
-                    event_el = item.select_one(".match-item-event-series")
-                
-                event_text = event_el.get_text(strip=True) if event_el else ""
-                
-                # FILTER: Only include Tier 1 VCT events
-                is_tier1 = any(tier1 in event_text.upper() for tier1 in TIER1_EVENTS)
-                
-                if not is_tier1:
-                    logger.info(f"Skipping non-Tier 1: {event_text}")
-                    continue
-                
-                # Try to get exact timestamp
-                time_el = item.select_one(".match-item-time")
-                start_time = current_date
-                
-                if time_el and time_el.get("data-utc-ts"):
-                    try:
-                        ts = int(time_el.get("data-utc-ts"))
-                        dt = datetime.utcfromtimestamp(ts)
-                        start_time = dt.isoformat()
-                    except:
-                        pass
-                
-                matches.append({
-                    "id": match_id,
-                    "team1": teams[0],
-                    "team2": teams[1],
-                    "event": event_text,
-                    "start_time": start_time
-                })
-                
-                logger.info(f"Added match: {teams[0]} vs {teams[1]} - {event_text} on {start_time}")
-                
+                match = _parse_match_item(node, current_date)
             except Exception as e:
-                logger.warning(f"Error parsing match item: {e}")
+                logger.warning("Error parsing match item: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
                 continue
+            if match:
+                matches.append(match)
         
         if not matches:
             raise HTTPException(status_code=500, detail="Could not find matches")
         
-        logger.info(f"Returning {len(matches)} Tier 1 matches")
+        logger.info("Returning %d Tier 1 matches", len(matches))
         return {"matches": matches}
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Unexpected error: {e}")
+        logger.exception("Unexpected error parsing matches: %s", e)
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+def _parse_match_item(node, current_date):
+    """Turn one .match-item anchor into a match dict, or None if it should be skipped"""
+    # Get match ID
+    href = node.get("href", "")
+    match_id_match = _MATCH_ID_RE.search(href)
+    if not match_id_match:
+        return None
+    match_id = match_id_match.group(1)
+    parts = _item_parts(node)
+    
+    # Get teams
+    teams = []
+    for team_el in parts.get("match-item-vs-team-name", [])[:2]:
+        team_name = _text(team_el)
+        if team_name:
+            teams.append(team_name)
+    
+    if len(teams) < 2:
+        return None
+    
+    # Get event name
+    event_el = parts.get("match-item-event") or parts.get("match-item-event-series")
+    
+    event_text = _text(event_el[0]) if event_el else ""
+    
+    # FILTER: Only include Tier 1 VCT events
+    is_tier1 = TIER1_RE.search(event_text) is not None
+    
+    if not is_tier1:
+        logger.debug("Skipping non-Tier 1: %s", event_text)
+        return None
+    
+    # Try to get exact timestamp
+    time_el = parts.get("match-item-time")
+    start_time = current_date
+    
+    ts = time_el[0].get("data-utc-ts", "") if time_el else ""
+    if ts.isascii() and ts.isdigit():
+        try:
+            start_time = _utc_iso(int(ts))
+        except (OverflowError, OSError, ValueError):
+            pass  # out-of-range timestamp, keep the header date
+    
+    logger.debug("Added match: %s vs %s - %s on %s", teams[0], teams[1], event_text, start_time)
+    
+    return {
+        "id": match_id,
+        "team1": teams[0],
+        "team2": teams[1],
+        "event": event_text,
+        "start_time": start_time
+    }
+
+@app.get("/matches/batch")
+async def get_matches_batch(ids: str):
+    """Get details for several matches in one call, e.g. ?ids=593680,593681"""
+    match_ids = list(dict.fromkeys(i.strip() for i in ids.split(",") if i.strip()))
+    if not match_ids:
+        raise HTTPException(status_code=400, detail="No match ids given")
+    if len(match_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} match ids per batch")
+    for match_id in match_ids:
+        _check_match_id(match_id)
+    
+    # Fetched concurrently over the shared connection pool
+    results = await asyncio.gather(*(_match_payload(i) for i in match_ids), return_exceptions=True)
+    
+    matches = []
+    for match_id, result in zip(match_ids, results):
+        if isinstance(result, HTTPException):
+            matches.append({"id": match_id, "error": result.detail})
+        elif isinstance(result, Exception):
+            matches.append({"id": match_id, "error": str(result)})
+        else:
+            matches.append(result)
+    return ORJSONResponse({"matches": matches})
+
 @app.get("/match/{match_id}")
 async def get_match(match_id: str):
     """Get match details from VLR.gg"""
-    url = f"https://www.vlr.gg/{match_id}"
-    
-    async with httpx.AsyncClient(timeout=20.0) as client:
+    _check_match_id(match_id)
+    return ORJSONResponse(await _match_payload(match_id))
+
+def _check_match_id(match_id):
+    """Reject anything but a numeric id so clients can't fetch (and cache) arbitrary vlr.gg paths"""
+    if not (match_id.isascii() and match_id.isdigit()):
+        raise HTTPException(status_code=400, detail=f"Invalid match id: {match_id}")
+
+async def _match_payload(match_id):
+    return await _cached(f"match:{match_id}", MATCH_TTL, partial(_scrape_match, match_id))
+
+def _spawn(coro):
+    """Run `coro` in the background, keeping a reference until it finishes"""
+    task = asyncio.create_task(coro)
+    _BACKGROUND.add(task)
+    task.add_done_callback(_BACKGROUND.discard)
+
+async def _warm_matches(match_ids):
+    """Pre-populate the cache for the match pages clients usually open next"""
+    for match_id in match_ids:
+        # Already cached, fresh or stale: a client request will refresh it
+        if f"match:{match_id}" in _CACHE:
+            continue
         try:
-            response = await client.get(url, headers=HEADERS, follow_redirects=True)
-            response.raise_for_status()
-        except:
+            await _match_payload(match_id)
+        except Exception as e:
+            logger.warning("Failed to prefetch match %s: %s", match_id, e)
+
+async def _scrape_match(match_id):
+    path = f"/{match_id}"
+    cached = _CACHE.get(f"match:{match_id}")
+
+    try:
+        response = await _vlr_get(path, cached[2] if cached else None)
+    except httpx.HTTPStatusError as e:
+        status = e.response.status_code
+        if status == 404:
             raise HTTPException(status_code=404, detail="Match not found")
-    
-    soup = BeautifulSoup(response.text, "lxml")
-    
+        if status == 429:
+            raise HTTPException(status_code=503, detail="Rate limited by VLR.gg")
+        raise HTTPException(status_code=502, detail=f"VLR.gg returned {status}")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Failed to fetch: {e}")
+
+    if response.status_code == 304:
+        return cached[1], cached[2]
+
     return {
         "id": match_id,
         "status": "ok"
-    }
+    }, _validators(response)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Each worker is its own process with its own client pool, response cache
+    # and upstream semaphore, so upstream load grows with the worker count.
+    # loop/http stay on "auto", which picks uvloop and httptools where installed.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.environ.get("WEB_CONCURRENCY", 1)),
+    )